@@ -1,9 +1,36 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from pick import pick
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
 
 BASE_URL = "https://www.supraphonline.cz"
+SEARCH_WORKERS = 10  # parallel searches before the interactive part
+REQUEST_TIMEOUT = 10  # seconds, a stalled connection would block a pool slot forever
+RELEASE_YEAR_CACHE = "release_year_cache.json"  # track url -> confirmed year, kept between runs
+
+# Only the parts of the pages we actually read get turned into a tree
+TRACK_ROWS = SoupStrainer("tr", class_="track")
+TRACK_DETAIL = SoupStrainer("div", class_="_trackdetail")
+YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+
+# Keep-alive connections to Supraphonline are shared by all the requests
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=SEARCH_WORKERS,
+    pool_maxsize=SEARCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
 
 def read_song_list(filename="song_list.txt"):
     """Read the list of songs from a text file."""
@@ -13,15 +40,16 @@ def read_song_list(filename="song_list.txt"):
 def search_song(song_title):
     """Search Supraphonline for a song and return a list of results."""
     search_url = f"{BASE_URL}/vyhledavani"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
     params = {"q": song_title}
-    response = requests.get(search_url, headers=headers, params=params)
-    soup = BeautifulSoup(response.text, "html.parser")
+    response = SESSION.get(search_url, params=params, timeout=REQUEST_TIMEOUT)
+    soup = BeautifulSoup(response.content, PARSER, parse_only=TRACK_ROWS)
+    tracks = soup.find_all("tr", class_="track")
+    if not tracks:
+        soup = BeautifulSoup(response.content, PARSER)
+        tracks = soup.find_all("tr", class_="track")
     results = []
 
-    for track in soup.find_all("tr", class_="track"):
+    for track in tracks:
         td_tags = track.find_all("td")
         if len(td_tags) < 5:
             continue
@@ -41,24 +69,40 @@ def search_song(song_title):
     return results
 
 
+def try_search_song(song_title):
+    """Like search_song, but a failed search gives no results instead of ending the run."""
+    try:
+        return search_song(song_title)
+    except Exception as e:
+        print(f"Search for {song_title} failed: {e}")
+        return []
+
+
+def find_track_summary(soup):
+    """Find the <ul class="summary"> inside <div class="_trackdetail">."""
+    track_detail = soup.find("div", class_="_trackdetail")
+    if track_detail is None:
+        return None
+    return track_detail.find("ul", class_="summary")
+
+
 def get_release_year(track_url):
     """Get the release year from the song's track page."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
-    response = requests.get(track_url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
+    response = SESSION.get(track_url, timeout=REQUEST_TIMEOUT)
+    soup = BeautifulSoup(response.content, PARSER, parse_only=TRACK_DETAIL)
 
     # Find the summary <ul> inside _trackdetail
-    summary_ul = soup.select_one("div._trackdetail ul.summary")
+    summary_ul = find_track_summary(soup)
+    if summary_ul is None:
+        soup = BeautifulSoup(response.content, PARSER)
+        summary_ul = find_track_summary(soup)
     if summary_ul:
         for li in summary_ul.find_all("li"):
             span = li.find("span")
             if span and "Rok prvního vydání" in span.text:
                 # Extract the year text after the span
                 year_text = li.get_text(separator=" ").replace(span.text, "").strip()
-                import re
-                match = re.search(r"\b(19|20)\d{2}\b", year_text)
+                match = YEAR_RE.search(year_text)
                 if match:
                     return match.group(0)
                 else:
@@ -66,13 +110,32 @@ def get_release_year(track_url):
     return None
 
 
+def load_release_year_cache():
+    """Load the release years looked up by earlier runs."""
+    try:
+        with open(RELEASE_YEAR_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_release_year_cache(cache):
+    with open(RELEASE_YEAR_CACHE, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(cache, ensure_ascii=False, indent=4))
+
+
 def main():
     song_list = read_song_list()
     final_results = []
+    year_cache = load_release_year_cache()
 
-    for song in song_list:
-        print(f"\nSearching for: {song}")
-        results = search_song(song)
+    # The searches don't need any user input, run them all up front
+    print(f"Searching for {len(song_list)} songs...")
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        search_results = list(executor.map(try_search_song, song_list))
+
+    for song, results in zip(song_list, search_results):
+        print(f"\nResults for: {song}")
 
         if not results:
             final_results.append({
@@ -90,7 +153,8 @@ def main():
 
         # Get release year
         track_id = selected_song['track_url'].split("trackId=")[-1]
-        release_year = get_release_year(selected_song['track_url'])
+        track_url = selected_song['track_url']
+        release_year = year_cache.get(track_url) or get_release_year(track_url)
         if release_year:
             print(f"Found release year: {release_year}")
             confirm_year = input(f"Confirm or edit the release year for '{selected_song['title']}' (leave blank to keep): ")
@@ -99,6 +163,11 @@ def main():
         else:
             release_year = input(f"Enter release year for '{selected_song['title']}': ")
 
+        # Remember the year the user settled on, a failed lookup is not cached
+        if release_year and release_year != year_cache.get(track_url):
+            year_cache[track_url] = release_year
+            save_release_year_cache(year_cache)
+
         final_results.append({
             "title": selected_song['title'],
             "artist": selected_song['artist'],
@@ -10,13 +10,17 @@ Features:
 - Prints final mapping.
 """
 
+import os
 import time
+from functools import lru_cache
 from typing import Dict, Optional
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.keys import Keys
 
@@ -34,8 +38,19 @@ SUGGESTIONS_CONTAINER_SELECTORS = [
 SUGGESTION_ITEM_SELECTORS = [
     "div.ais-Hits-item", "li.ais-Hits-item", "a.ais-Hits-item"
 ]
-TYPING_DELAY = 0.05  # seconds per keystroke
+ANY_SUGGESTION_ITEM = ", ".join(SUGGESTION_ITEM_SELECTORS)
 PAGE_LOAD_TIMEOUT = 7  # max seconds to wait for homepage
+HITS_QUIET_TIME = 0.3  # seconds the suggestions must stay unchanged to count as final
+SET_QUERY_SCRIPT = """
+const input = arguments[0];
+const setValue = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+setValue.call(input, arguments[1]);
+input.dispatchEvent(new Event('input', {bubbles: true}));
+"""
+HITS_TEXT_SCRIPT = (
+    "return Array.from(document.querySelectorAll(arguments[0]), el => el.textContent).join('\\n');"
+)
+CHROMEDRIVER = os.environ.get("CHROMEDRIVER")  # pinned driver path, skips webdriver_manager
 
 # --- Functions ---
 
@@ -46,44 +61,79 @@ def create_driver(headless: bool = True):
         chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
+    # Don't download images, only the search suggestions matter
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    service = Service(CHROMEDRIVER or ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=chrome_options)
     driver.set_window_size(1200, 900)
     driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
     return driver
 
+def hits_settled(search_input, expected_value: str, hits_before: str,
+                 require_change: bool = True, quiet: float = HITS_QUIET_TIME):
+    """
+    Wait condition: the input holds expected_value and the suggestions have not changed
+    for quiet seconds. With require_change, only a change away from hits_before seen
+    while the input holds expected_value starts the quiet period.
+    An empty result list is a result too, so "no results" settles like any other.
+    """
+    last_hits = hits_before
+    changed_at = None if require_change else time.monotonic()
+
+    def condition(driver):
+        nonlocal last_hits, changed_at
+        if search_input.get_attribute("value") != expected_value:
+            return False
+        hits = driver.execute_script(HITS_TEXT_SCRIPT, ANY_SUGGESTION_ITEM)
+        now = time.monotonic()
+        if hits != last_hits:
+            last_hits, changed_at = hits, now
+            return False
+        return changed_at is not None and now - changed_at >= quiet
+
+    return condition
+
+def wait_for_hits(driver, search_input, expected_value: str, hits_before: str, require_change: bool = True):
+    try:
+        WebDriverWait(driver, 3, poll_frequency=0.1).until(
+            hits_settled(search_input, expected_value, hits_before, require_change)
+        )
+    except TimeoutException:
+        pass
+
 def search_top_result(driver, query: str) -> Optional[str]:
     """
     Search for the query in the already loaded page and return the URL of the first suggestion.
     Returns None if no suggestions are found.
     """
-    search_input = None
-    start_time = time.time()
-    max_wait = 3
-    while time.time() - start_time < max_wait:
-        try:
-            search_input = driver.find_element(By.CSS_SELECTOR, SEARCH_INPUT_SELECTOR)
-            if search_input:
-                break
-        except:
-            time.sleep(0.2)
-    if not search_input:
+    try:
+        search_input = WebDriverWait(driver, 3).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, SEARCH_INPUT_SELECTOR))
+        )
+    except TimeoutException:
         print(f"Search input not found for query '{query}'. Skipping.")
         return None
 
-    # --- Clear the input robustly ---
+    # the suggestions only show while the box has focus
     search_input.click()
-    search_input.clear()
-    # Select all + backspace to ensure field is empty
-    search_input.send_keys(Keys.COMMAND + "a")
-    search_input.send_keys(Keys.BACKSPACE)
-    time.sleep(0.1)
 
-    # Type the query
-    for ch in query:
-        search_input.send_keys(ch)
-        time.sleep(TYPING_DELAY)
-    time.sleep(1)
+    # Let whatever search is still in flight finish rendering first
+    current_value = search_input.get_attribute("value")
+    hits_before = driver.execute_script(HITS_TEXT_SCRIPT, ANY_SUGGESTION_ITEM)
+    wait_for_hits(driver, search_input, current_value, hits_before, require_change=False)
+
+    # The same query again (duplicate songs) already shows its results
+    if current_value != query:
+        hits_before = driver.execute_script(HITS_TEXT_SCRIPT, ANY_SUGGESTION_ITEM)
+        # Replace the value in one input event: clearing first or typing key by key
+        # would start searches for "" and every prefix, whose hits can land late
+        driver.execute_script(SET_QUERY_SCRIPT, search_input, query)
+        wait_for_hits(driver, search_input, query, hits_before)
+
     # Try multiple possible containers
     container = None
     for sel in SUGGESTIONS_CONTAINER_SELECTORS:
@@ -132,18 +182,20 @@ def select_only_songs(driver):
     """
     Type two letters to trigger the refinement filters, then select 'Písnička' only.
     """
-    search_input = driver.find_element(By.CSS_SELECTOR, SEARCH_INPUT_SELECTOR)
+    search_input = WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, SEARCH_INPUT_SELECTOR))
+    )
     # type two letters to trigger filter
     search_input.send_keys("aa")
-    time.sleep(0.5)  # wait for refinement filters to render
 
     try:
-        checkbox = driver.find_element(
-            By.CSS_SELECTOR, "input.ais-RefinementList-checkbox[value='Písnička']"
-        )
+        checkbox_locator = (By.CSS_SELECTOR, "input.ais-RefinementList-checkbox[value='Písnička']")
+        # wait for refinement filters to render
+        checkbox = WebDriverWait(driver, 3).until(EC.element_to_be_clickable(checkbox_locator))
         if not checkbox.is_selected():
             checkbox.click()
-            time.sleep(0.5)  # wait for filter to apply
+            # wait for filter to apply
+            WebDriverWait(driver, 3).until(EC.element_located_selection_state_to_be(checkbox_locator, True))
     except Exception as e:
         print(f"Warning: could not select 'Písnička' filter: {e}")
 
@@ -156,7 +208,9 @@ def select_only_songs(driver):
     else:
         search_input.send_keys(Keys.CONTROL + "a")
     search_input.send_keys(Keys.BACKSPACE)
-    time.sleep(0.1)
+    # let the empty query's hits render before the first search
+    hits_before = driver.execute_script(HITS_TEXT_SCRIPT, ANY_SUGGESTION_ITEM)
+    wait_for_hits(driver, search_input, "", hits_before)
 
 ############################################################################
 
@@ -164,28 +218,39 @@ BASIC_CHARS = set("ABCDEFGH")   # basic chord characters
 SPACE = " "
 TILDE = "~"
 
+# compiled once, these run for every line of every song
+_MINOR_RE = re.compile(r"(?<!i)m($|[^a-z])")
+_NON_CHORD_CHAR_RE = re.compile(r"[^A-Za-z#b]")
+_CHORD_TOKEN_RE = re.compile(r"([A-H][#b]?(?:mi|m)?[0-9()\/\-]*)")
+_PREV_CHORD_RE = re.compile(r"\}\s*$")
+# numbered paragraph ("1.", "2)") or any label ending with ':', numbers first
+_SECTION_START_RE = re.compile(r"^(?:(?P<number>\s*\d+[\.\)])|(?P<label>\s*[\w\s]+:))\s*(?P<rest>.*)")
+
+# a song only uses a handful of distinct chords, each is normalized once
+@lru_cache(maxsize=256)
 def normalize_chord(ch):
     """Normalize m → mi."""
-    ch = re.sub(r"(?<!i)m($|[^a-z])", r"mi\1", ch)
+    ch = _MINOR_RE.sub(r"mi\1", ch)
     return ch
 
 
+# the same chord rows come back in every verse, remember the verdict per line
+@lru_cache(maxsize=4096)
 def likely_chord_line(line):
     """Heuristic: many blanks + at least 1/4 characters chordish."""
-    stripped = line.strip()
-    if not stripped:
-        return False
-    pure = re.sub(r"[^A-Za-z#b]", "", line)
-    if not pure:
+    # blank lines have no letters either, so the length check covers them
+    pure_length = len(_NON_CHORD_CHAR_RE.sub("", line))
+    if not pure_length:
         return False
-    frac = sum(1 for c in pure if c in BASIC_CHARS) / len(pure)
+    # every basic chord char survives the cleanup, so count them in the line
+    frac = sum(map(line.count, BASIC_CHARS)) / pure_length
     return frac >= 0.25
 
 
 def extract_chords_positions(line):
     """Return list of (pos, chord) from chord line."""
     positions = []
-    tokens = re.finditer(r"([A-H][#b]?(?:mi|m)?[0-9()\/\-]*)", line)
+    tokens = _CHORD_TOKEN_RE.finditer(line)
     for m in tokens:
         chord = normalize_chord(m.group(1))
         positions.append((m.start(), chord))
@@ -212,34 +277,33 @@ def place_chords_in_lyric(chord_positions, lyric_line, label_offset=0):
             pos = len(line) - 1
         inserts.append((pos, chord))
 
-    inserts.sort(reverse=True)
-
+    # walk the inserts left to right and splice the marks in one join
+    inserts.sort()
+    parts = []
+    last = 0
     for pos, chord in inserts:
-        before = line[:pos].rstrip()
-        after = line[pos:].lstrip()
-
-        insert_at = pos - 1
+        insert_at = max(0, pos - 1)
         chord_mark = f"^{{{chord}}}"
 
         # Check adjacency to previous chord
-        prev_chord_collision = False
-        search = line[:insert_at]
-        if re.search(r"\}\s*$", search) is not None:
-            prev_chord_collision = True
+        prev_chord_collision = _PREV_CHORD_RE.search(line, 0, insert_at) is not None
 
         if prev_chord_collision:
             chord_mark = f"^*{{{chord}}} "
         else:
-            words = before.split()
-            last_word = words[-1] if words else ""
+            before = line[:pos].rstrip()
+            last_word = before.rsplit(None, 1)[-1] if before else ""
             if len(last_word) < 3:
                 chord_mark += TILDE
             else:
                 chord_mark += SPACE
 
-        line = line[:insert_at] + chord_mark + line[insert_at:]
+        parts.append(line[last:insert_at])
+        parts.append(chord_mark)
+        last = insert_at
 
-    return line
+    parts.append(line[last:])
+    return "".join(parts)
 
 def convert_block_to_list(text):
     """
@@ -257,10 +321,11 @@ def convert_block_to_list(text):
     for line in lines:
         stripped = line.strip()
 
-        # Numbered paragraph (verse)
-        m_number = re.match(r"^(\s*\d+[\.\)])\s*(.*)", line)
-        # Generic label ending with ':' (Chorus:, Bridge:, Pause:, etc.)
-        m_label = re.match(r"^(\s*[\w\s]+:)\s*(.*)", line)
+        # Numbered paragraph (verse) or generic label ending with ':'
+        # (Chorus:, Bridge:, Pause:, etc.), both from one match
+        m_start = _SECTION_START_RE.match(line)
+        m_number = m_start and m_start.group("number")
+        m_label = m_start and m_start.group("label")
 
         if m_number:
             # Save previous section
@@ -270,8 +335,8 @@ def convert_block_to_list(text):
             current_lines = []
 
             # Compute offset for label
-            label_offset = len(m_number.group(1))
-            lyric_text = m_number.group(2)
+            label_offset = len(m_number)
+            lyric_text = m_start.group("rest")
             if lyric_text:
                 converted = place_chords_in_lyric(pending_chords, lyric_text, label_offset)
                 pending_chords = []
@@ -282,11 +347,11 @@ def convert_block_to_list(text):
             if current_lines:
                 sections_list.append([current_section, "\n".join(current_lines)])
             # Use the label name as section name (lowercased)
-            current_section = m_label.group(1).strip().rstrip(':').lower()
+            current_section = m_label.strip().rstrip(':').lower()
             current_lines = []
 
-            label_offset = len(m_label.group(1))
-            lyric_text = m_label.group(2)
+            label_offset = len(m_label)
+            lyric_text = m_start.group("rest")
             if lyric_text:
                 converted = place_chords_in_lyric(pending_chords, lyric_text, label_offset)
                 pending_chords = []
@@ -370,8 +435,7 @@ def main():
         except TimeoutException:
             print("Warning: homepage load timed out, proceeding...")
 
-        time.sleep(1)
-        # Select only songs filter once
+        # Select only songs filter once, it waits for the search box itself
         select_only_songs(driver)
         
         with open("song_metadata.json") as input_file:
@@ -6,17 +6,25 @@ Behavior:
 - Loads song metadata JSON with schema:
   [{"title": "...", "artist": "...", "release_year": "...", "url": "https://.../song-slug"}, ...]
 - Opens each song URL in a visible Chrome browser using Selenium.
-- Waits up to 3 seconds for page load, then cancels loading.
+- Waits up to 3 seconds for the chords <pre> to appear, then stops loading the rest.
 - Clicks the cookie consent button automatically if found.
 - If there is no <ul id="trans" class="pagination"> element, extracts chords immediately.
-- Otherwise, waits for user manual transposition and confirmation before extraction.
-- Adds 'chords' key to each song and exports to song_with_chords.json.
+- Otherwise, lets the user pick a transposition in the terminal and loads its link,
+  or, if the controls are not plain links, waits for manual transposition in the browser.
+- Adds 'chords' key to each song and exports to song_with_chords.json. Songs are
+  appended to song_with_chords.jsonl as they are done and merged at the end, so a
+  crashed run keeps its progress.
+- Extracted chords are cached per URL in .chords_cache/ so reruns don't open the
+  browser again; pass --no-cache to scrape everything anew.
 """
 
+import gzip
+import hashlib
 import json
 import os
+import sys
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -29,10 +37,34 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from webdriver_manager.chrome import ChromeDriverManager
+from pick import pick
 
 INPUT_JSON = "song_metadata_with_url.json"
 OUTPUT_JSON = "song_with_chords.json"
-PAGE_LOAD_TIMEOUT = 3  # seconds before canceling page load
+PROGRESS_JSONL = "song_with_chords.jsonl"  # songs scraped so far, merged into OUTPUT_JSON at the end
+PAGE_LOAD_TIMEOUT = 3  # seconds to wait for the chords before canceling page load
+CHROMEDRIVER = os.environ.get("CHROMEDRIVER")  # pinned driver path, skips webdriver_manager
+BLOCKED_URLS = [  # never needed for reading the chords
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.woff*", "*.ttf",
+    "*googletag*", "*googlesyndication*", "*analytics*", "*doubleclick*",
+]
+CACHE_DIR = ".chords_cache"  # extracted chords per URL, skip with --no-cache
+
+BEST_PRE_SCRIPT = """
+let best = null;
+for (const pre of document.getElementsByTagName("pre")) {
+    const text = pre.textContent || "";
+    if (best === null || text.length > best.length) {
+        best = text;
+    }
+}
+return best;
+"""
+
+TRANSPOSITION_LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll("ul#trans li a"))
+    .map(a => [a.textContent.trim(), a.getAttribute("href") ? a.href : ""]);
+"""
 
 
 # ---------- File I/O ----------
@@ -46,13 +78,67 @@ def load_metadata(path: str) -> List[Dict]:
     return data
 
 
-def save_output(path: str, data: List[Dict]):
-    breakpoint()
-    with open(path, "r", encoding="utf-8") as input_file:
-        existing_data = json.loads(input_file.read())
-    existing_data.extend(data)
-    with open(path, "w", encoding="utf-8") as f:
+def append_output(path: str, song: Dict):
+    """Append a single song as one JSON line, so progress survives a crash."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(song, ensure_ascii=False) + "\n")
+
+
+def jsonl_to_json(jsonl_path: str, json_path: str):
+    """Merge the songs collected in jsonl_path into the JSON list in json_path."""
+    existing_data = []
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as input_file:
+            existing_data = json.load(input_file)
+    with open(jsonl_path, "r", encoding="utf-8") as input_file:
+        new_data = [json.loads(line) for line in input_file if line.strip()]
+    # a retried song replaces the failed entry saved by an earlier run
+    new_keys = {(song.get("title"), song.get("url")) for song in new_data}
+    existing_data = [song for song in existing_data if (song.get("title"), song.get("url")) not in new_keys]
+    existing_data.extend(new_data)
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(existing_data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, json_path)
+    os.remove(jsonl_path)
+
+
+def load_done_songs() -> set:
+    """Return (title, url) of the songs already in OUTPUT_JSON or PROGRESS_JSONL.
+
+    Songs with a URL but no chords failed to extract and are left out, so they get retried.
+    """
+    songs = []
+    if os.path.exists(OUTPUT_JSON):
+        with open(OUTPUT_JSON, "r", encoding="utf-8") as input_file:
+            songs.extend(json.load(input_file))
+    if os.path.exists(PROGRESS_JSONL):
+        with open(PROGRESS_JSONL, "r", encoding="utf-8") as input_file:
+            songs.extend(json.loads(line) for line in input_file if line.strip())
+    return {
+        (song.get("title"), song.get("url"))
+        for song in songs
+        if song.get("chords") or not song.get("url")
+    }
+
+
+def cache_path(url: str) -> str:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.txt.gz")
+
+
+def load_cached_chords(url: str) -> Optional[str]:
+    path = cache_path(url)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def store_cached_chords(url: str, chords: str):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with gzip.open(cache_path(url), "wt", encoding="utf-8") as f:
+        f.write(chords)
 
 
 # ---------- Browser setup ----------
@@ -61,8 +147,18 @@ def create_driver() -> webdriver.Chrome:
     options.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
     options.add_experimental_option("useAutomationExtension", False)
     options.add_argument("--start-maximized")
-    service = ChromeService(ChromeDriverManager().install())
+    # Don't download images, we only read text from the page
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    # Return from driver.get() immediately, extract_chords_for_song waits for the <pre>
+    options.page_load_strategy = "none"
+    service = ChromeService(CHROMEDRIVER or ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=options)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
     driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
     return driver
 
@@ -94,19 +190,15 @@ def page_has_transposition(driver: webdriver.Chrome) -> bool:
 
 
 def find_best_pre_text(driver: webdriver.Chrome) -> Optional[str]:
-    """Return the textContent of the <pre> element with the longest content."""
-    pres = driver.find_elements(By.TAG_NAME, "pre")
-    best_text = None
-    best_len = -1
-    for el in pres:
-        try:
-            txt = el.get_attribute("textContent") or ""
-            if len(txt) > best_len:
-                best_len = len(txt)
-                best_text = txt
-        except WebDriverException:
-            continue
-    return best_text
+    """
+    Return the textContent of the <pre> element with the longest content.
+    """
+    # Done in a single script so the browser walks the DOM natively instead of
+    # one WebDriver round-trip per <pre> element.
+    try:
+        return driver.execute_script(BEST_PRE_SCRIPT)
+    except WebDriverException:
+        return None
 
 
 def fallback_page_text(driver: webdriver.Chrome) -> str:
@@ -118,18 +210,43 @@ def fallback_page_text(driver: webdriver.Chrome) -> str:
         return ""
 
 
+def transposition_links(driver: webdriver.Chrome) -> List[Tuple[str, str]]:
+    """Return (key, href) of the transposition links that lead to a real URL."""
+    try:
+        links = driver.execute_script(TRANSPOSITION_LINKS_SCRIPT) or []
+    except WebDriverException:
+        return []
+    return [
+        (key, href) for key, href in links
+        if key and href and not href.endswith("#") and not href.startswith("javascript:")
+    ]
+
+
 # ---------- Core extraction ----------
-def extract_chords_for_song(driver: webdriver.Chrome, url: str) -> str:
-    print(f"\nOpening: {url}")
+def open_page(driver: webdriver.Chrome, url: str):
+    """Load url and wait until the chords are on the page."""
     try:
         driver.get(url)
+        WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
+            EC.presence_of_element_located((By.TAG_NAME, "pre"))
+        )
+        # make sure the rest of the HTML (transposition controls) is parsed too
+        WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
+            lambda d: d.execute_script("return document.readyState") != "loading"
+        )
     except TimeoutException:
-        print(f"⚠️ Page load timeout after {PAGE_LOAD_TIMEOUT}s — proceeding anyway.")
-        # Stop page load manually
-        try:
-            driver.execute_script("window.stop();")
-        except Exception:
-            pass
+        print(f"⚠️ Page not ready after {PAGE_LOAD_TIMEOUT}s — proceeding anyway.")
+
+    # Stop loading images, ads and trackers, we only need the text
+    try:
+        driver.execute_script("window.stop();")
+    except Exception:
+        pass
+
+
+def extract_chords_for_song(driver: webdriver.Chrome, url: str) -> str:
+    print(f"\nOpening: {url}")
+    open_page(driver, url)
 
     # Click cookie consent if appears
     click_cookie_consent(driver)
@@ -145,8 +262,15 @@ def extract_chords_for_song(driver: webdriver.Chrome, url: str) -> str:
             print("No <pre> found, falling back to full page text.")
             return fallback_page_text(driver)
 
-    print("Transposition controls detected — please choose your transposition manually.")
-    input("When ready, press Enter to extract chords...")
+    links = transposition_links(driver)
+    if links:
+        keep = "Keep current"
+        _, index = pick([keep] + [key for key, _ in links], "Transposition:")
+        if index > 0:
+            open_page(driver, links[index - 1][1])
+    else:
+        print("Transposition controls detected — please choose your transposition manually.")
+        input("When ready, press Enter to extract chords...")
 
     pre_text = find_best_pre_text(driver)
     if pre_text:
@@ -161,6 +285,8 @@ def extract_chords_for_song(driver: webdriver.Chrome, url: str) -> str:
 def main():
     print("Loading input JSON:", INPUT_JSON)
     songs = load_metadata(INPUT_JSON)
+    use_cache = "--no-cache" not in sys.argv[1:]
+    done_songs = load_done_songs()
 
     processed = {}
     driver = None
@@ -170,20 +296,28 @@ def main():
         print("Could not start Chrome:", e)
         return
 
-    results = []
     try:
         for idx, song in enumerate(songs, start=1):
             print(f"\n--- ({idx}/{len(songs)}) {song.get('title', 'Unknown')} ---")
             url = song.get("url")
+            if (song.get("title"), url) in done_songs:
+                print("Already saved; skipping.")
+                continue
             if not url:
                 print("No URL found; skipping.")
-                results.append({**song, "chords": ""})
+                append_output(PROGRESS_JSONL, {**song, "chords": ""})
                 continue
 
             if url in processed:
                 print("Reusing previously extracted chords.")
                 cached = processed[url]
-                results.append({**song, "chords": cached.get("chords", "")})
+                append_output(PROGRESS_JSONL, {**song, "chords": cached.get("chords", "")})
+                continue
+
+            if use_cache and (chords := load_cached_chords(url)) is not None:
+                print("Using cached chords for", url)
+                processed[url] = {"chords": chords}
+                append_output(PROGRESS_JSONL, {**song, "chords": chords})
                 continue
 
             try:
@@ -192,8 +326,14 @@ def main():
             except Exception as e:
                 print("Error extracting chords:", e)
                 chords = ""
+            if not chords:
+                # not saved, so the next run tries this song again
+                print("No chords extracted; will retry on the next run.")
+                continue
+            store_cached_chords(url, chords)
+            processed[url] = {"chords": chords}
 
-            results.append({**song, "chords": chords})
+            append_output(PROGRESS_JSONL, {**song, "chords": chords})
             time.sleep(0.3)
 
     finally:
@@ -205,7 +345,8 @@ def main():
                 pass
 
     print(f"\nSaving results to {OUTPUT_JSON} ...")
-    save_output(OUTPUT_JSON, results)
+    if os.path.exists(PROGRESS_JSONL):
+        jsonl_to_json(PROGRESS_JSONL, OUTPUT_JSON)
     print("Done. Saved to", OUTPUT_JSON)
 
 
@@ -1,57 +1,55 @@
-from enum import StrEnum, auto, Flag
+from enum import auto, IntFlag
+from functools import lru_cache
 import re
 import tempfile
 import subprocess
+import shlex
 import os
+from pathlib import Path
 from pick import pick
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from slugify import slugify
 
-## User Input Handling ############################################################
-
-def format_all_songs():
-    # load songs from songs_with_chords.json
-    for song in songs:
-        # ask for y/n/a/r
-        formatted_song = format_song(song)
+_WS_RE = re.compile(r"\s")
+_NON_WS_RE = re.compile(r"[^\s]")
+_TOKEN_RE = re.compile(r"[^\s]+")
+_DOT_COLON_RE = re.compile(r"[.:]")
 
-class Command(Flag):
-    ACCEPT = auto()
-    RETRY_PREDICTION_WITH_CHANGES = auto()
-    RETRY_PREDICTION_IGNORING_CHANGES = auto()
-    ABORT = auto()
+## User Input Handling ############################################################
 
 def present_to_user(content: str, filename: str = None, on_change = None) -> str:
     """
-    Opens the given content in Vim for editing and returns the modified content.
+    Opens the given content in $EDITOR (nvim if unset or empty) and returns the modified content.
     
     Parameters:
         content (str): The initial content to present to the user.
         filename (str, optional): If provided, use this file instead of a temporary one.
     
     Returns:
-        str: The modified content after the user exits Vim.
+        str: The modified content after the user exits the editor.
     """
     # Determine the file to use
     if filename:
         file_path = filename
         # Write initial content to the file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        write_if_changed(file_path, content)
     else:
         # Create a temporary file
-        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-        file_path = tmp_file.name
-        tmp_file.write(content.encode('utf-8'))
-        tmp_file.close()
+        fd, file_path = tempfile.mkstemp(suffix=".txt", text=True)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
 
     try:
-        # Open Vim as a subprocess
-        subprocess.run(['nvim', file_path])
+        # Open the editor as a subprocess, $EDITOR may carry its own arguments
+        editor = shlex.split(os.environ.get('EDITOR') or 'nvim')
+        subprocess.run([*editor, file_path])
 
         # Read the modified content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            modified_content = f.read()
+        modified_content = Path(file_path).read_text(encoding='utf-8')
     finally:
         # Clean up temporary file if used
         if not filename and os.path.exists(file_path):
@@ -59,9 +57,19 @@ def present_to_user(content: str, filename: str = None, on_change = None) -> str
 
     return modified_content
 
+def write_if_changed(path, content):
+    """Write content (str or bytes) to path unless the file already holds exactly that."""
+    path = Path(path)
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    # a different size means different content, no need to read the file
+    if path.exists() and path.stat().st_size == len(content) and path.read_bytes() == content:
+        return
+    path.write_bytes(content)
+
 ## Line prediction ################################################################
 
-class LineType(Flag):
+class LineType(IntFlag):
     EMPTY =  auto()
     VERSE =  auto()
     CHORUS = auto()
@@ -74,6 +82,22 @@ class LineType(Flag):
     SOLO_WITH_CHORDS =   auto()
     TEXT =   auto()
 
+GROUP_START = LineType.VERSE_WITH_CHORDS | LineType.CHORUS_WITH_CHORDS | LineType.BRIDGE_WITH_CHORDS | LineType.SOLO_WITH_CHORDS | LineType.VERSE | LineType.CHORUS | LineType.BRIDGE | LineType.SOLO
+HAS_CHORDS = LineType.VERSE_WITH_CHORDS | LineType.CHORUS_WITH_CHORDS | LineType.BRIDGE_WITH_CHORDS | LineType.SOLO_WITH_CHORDS
+GOBBLES_CHORDS = GROUP_START | LineType.TEXT
+SHOULD_BE_APPENDED = GROUP_START | LineType.TEXT
+
+GROUP_NAMES = {
+    LineType.VERSE: "verse",
+    LineType.VERSE_WITH_CHORDS: "verse",
+    LineType.CHORUS: "refren",
+    LineType.CHORUS_WITH_CHORDS: "refren",
+    LineType.BRIDGE: "deco",
+    LineType.BRIDGE_WITH_CHORDS: "deco",
+    LineType.SOLO: "solo",
+    LineType.SOLO_WITH_CHORDS: "solo",
+}
+
 def predict_line_types(lines):
     line_type_list = []
     for line in lines:
@@ -83,49 +107,59 @@ def predict_line_types(lines):
         elif is_chord_line(line):
             line_type = LineType.CHORDS
         elif (label := get_label(line)) != None:
-            if label.isnumeric():
-                line_type = LineType.VERSE
-            elif 'bridge' in label or '*' in label or 'intro' in label or 'outro' in label:
-                line_type = LineType.BRIDGE
-            elif 'chorus' in label or 'refren' in label or 'r' in label:
-                line_type = LineType.CHORUS
-            else:
-                line_type = LineType.SOLO
+            line_type = get_label_line_type(label)
         line_type_list.append(line_type)
     return list(zip(line_type_list, lines))
 
+LABEL_LINE_TYPES = {
+    **{label: LineType.BRIDGE for label in ("*", "intro", "outro", "bridge")},
+    **{label: LineType.CHORUS for label in ("r", "ref", "refren", "chorus")},
+}
+
+def get_label_line_type(label):
+    # the common labels are matched exactly, the rest by what they contain
+    if label.isnumeric():
+        return LineType.VERSE
+    elif label in LABEL_LINE_TYPES:
+        return LABEL_LINE_TYPES[label]
+    elif 'bridge' in label or '*' in label or 'intro' in label or 'outro' in label:
+        return LineType.BRIDGE
+    elif 'chorus' in label or 'refren' in label or 'r' in label:
+        return LineType.CHORUS
+    return LineType.SOLO
+
+# chorus and verse lines repeat a lot, each distinct line is checked once
+@lru_cache(maxsize=4096)
 def is_chord_line(line):
+    # most lines are lyrics, no chord letter at all means no chords
+    for c in line:
+        if 'A' <= c <= 'H':
+            break
+    else:
+        return False
     line = line.lstrip()
-    char_count = len(re.sub("\\s", "", line))
-    whitespace_count = len(line) - char_count
-    basic_chord_count = len(line) - len(re.sub("[A-H]", "", line))
+    whitespace_count = sum(map(str.isspace, line))
+    char_count = len(line) - whitespace_count
+    basic_chord_count = sum(map(line.count, "ABCDEFGH"))
     return whitespace_count > char_count - 4 and char_count - basic_chord_count < 8
 
 def get_label(line):
-    parts = re.split("[\\.:]", line)
+    # only the text before the first . or : matters
+    parts = _DOT_COLON_RE.split(line, maxsplit=1)
     if len(parts) <= 1:
         return None
     label = parts[0].strip()
-    if re.sub("\\s", "", label) == label:
+    if _WS_RE.sub("", label) == label:
         return label.lower()
     else: # likely a : that is part of a line
         return None
     
 def getGroupName(group_type):
-    if group_type in LineType.VERSE | LineType.VERSE_WITH_CHORDS:
-        return "verse"
-    elif group_type in LineType.CHORUS | LineType.CHORUS_WITH_CHORDS:
-        return "refren"
-    elif group_type in LineType.BRIDGE | LineType.BRIDGE_WITH_CHORDS:
-        return "deco"
-    elif group_type in LineType.SOLO | LineType.SOLO_WITH_CHORDS:
-        return "solo"
-    return ""
+    return GROUP_NAMES.get(group_type, "")
 
 def format_annotated_lines(lines):
     chord_buffer = ""
 
-    output_lines = []
     current_group_type = None
     group_lines = []
     group_padding = 0
@@ -133,69 +167,60 @@ def format_annotated_lines(lines):
 
     def end_group():
         nonlocal group_lines
-        nonlocal output_lines
         nonlocal current_group_type
         nonlocal group_padding
         nonlocal merge_chords
 
         if len(group_lines) > 0:
-            base_lines = [line + " \\\\" for line in group_lines[:-1]]
-            last_line = group_lines[-1]
-            output_lines.extend(base_lines)
-            output_lines.append(last_line)
-        output_lines.append(f"\\end{{{getGroupName(current_group_type)}}}")
+            for line in group_lines[:-1]:
+                yield line + " \\\\"
+            yield group_lines[-1]
+        yield f"\\end{{{getGroupName(current_group_type)}}}"
         current_group_type = None
         group_lines = []
         group_padding = 0
         merge_chords = False
 
-    group_start = LineType.VERSE_WITH_CHORDS | LineType.CHORUS_WITH_CHORDS | LineType.BRIDGE_WITH_CHORDS | LineType.SOLO_WITH_CHORDS | LineType.VERSE | LineType.CHORUS | LineType.BRIDGE | LineType.SOLO
-    has_chords = LineType.VERSE_WITH_CHORDS | LineType.CHORUS_WITH_CHORDS | LineType.BRIDGE_WITH_CHORDS | LineType.SOLO_WITH_CHORDS
-    gobbles_chords = group_start | LineType.TEXT
-    should_be_appended = group_start | LineType.TEXT
-
     for line_type, line in lines:
         if line_type == LineType.EMPTY and current_group_type is not None:
-            end_group()
-        elif line_type in group_start:
+            yield from end_group()
+        elif line_type & GROUP_START:
             if current_group_type is not None:
-                end_group()
+                yield from end_group()
 
             current_group_type = line_type
             group_padding = get_group_padding_length(line)
-            merge_chords = line_type in has_chords
-            output_lines.append(f"\\begin{{{getGroupName(current_group_type)}}}")
+            merge_chords = bool(line_type & HAS_CHORDS)
+            yield f"\\begin{{{getGroupName(current_group_type)}}}"
 
-        if line_type in should_be_appended:
+        if line_type & SHOULD_BE_APPENDED:
             if current_group_type is None:
                 group_padding = len(line) - len(line.lstrip())
                 if chord_buffer == "":
                     current_group_type = LineType.VERSE
                 else:
                     current_group_type = LineType.VERSE_WITH_CHORDS
-                output_lines.append(f"\\begin{{{getGroupName(current_group_type)}}}")
+                yield f"\\begin{{{getGroupName(current_group_type)}}}"
             if current_group_type == LineType.SOLO:
                 group_lines.append(format_solo_line(line[group_padding:]))
-            elif current_group_type in has_chords:
+            elif current_group_type & HAS_CHORDS:
                 group_lines.append(" " * 3 + merge(line[group_padding:], chord_buffer[group_padding:], False))
             else:
                 group_lines.append(" " * 3 + merge(line[group_padding:], chord_buffer[group_padding:], True))
         elif line_type == LineType.CHORDS:
             chord_buffer = line
             
-        if line_type in gobbles_chords:
+        if line_type & GOBBLES_CHORDS:
             chord_buffer = ""
 
     if current_group_type is not None:
-        end_group()
-
-    return output_lines
+        yield from end_group()
 
 def format_chord(chord, is_optional, is_special):
     return "\\" + ('h' if is_optional else 'm') + f"chord{ '*' if is_special else ''}{{{chord}}}"
 
 def format_solo_line(line):
-    chords = re.split("\\s", line)
+    chords = _WS_RE.split(line)
     return " ".join([f"\\inlinechord{{{chord}}}" for chord in chords])
 
 def merge(base, details, are_chords_optional):
@@ -215,33 +240,32 @@ def merge(base, details, are_chords_optional):
 
     # get shifts
     prev_detail_length = 0
-    while details != "":
-        left_padding_length = len(details) - len(details.lstrip())
-        details = details[left_padding_length:]
-        detail = re.split("\\s", details, maxsplit=1)[0]
-        detail_length = len(detail)
-        details = details[detail_length:]
-
-        detail_list.append(detail)
+    prev_detail_end = 0
+    for match in _TOKEN_RE.finditer(details):
+        detail_start, detail_end = match.span()
+        left_padding_length = detail_start - prev_detail_end
+
+        detail_list.append(match.group())
         segment_length_list.append(prev_detail_length + left_padding_length)
 
-        prev_detail_length = detail_length
+        prev_detail_length = detail_end - detail_start
+        prev_detail_end = detail_end
     if (last_segment_length := len(base) - sum(segment_length_list)) != 0:
         segment_length_list.append(last_segment_length)
 
     # setup so that we always add a chord and it's fill as a suffix (not prefix)
     total_segment_length = segment_length_list.pop(0)
-    merged = base[:total_segment_length]
+    merged_parts = [base[:total_segment_length]]
     segment_length_list.append(0)
     is_starred = False
     for index, (segment_length, detail) in enumerate(zip(segment_length_list, detail_list)):
         is_last = index == len(detail_list) - 1
         segment = base[total_segment_length:total_segment_length + segment_length]
-        segment_space_count = len(re.sub("[^\\s]", "", segment))
+        segment_space_count = len(_NON_WS_RE.sub("", segment))
         detail_length = max(len(detail) + 1, 3)
         if "m" in detail.lower() or "dim" in detail.lower():
             detail_length += 2
-        segment_far_space_count = 0 if detail_length >= len(segment) else len(re.sub("[^\\s]", "", segment[detail_length:]))
+        segment_far_space_count = 0 if detail_length >= len(segment) else len(_NON_WS_RE.sub("", segment[detail_length:]))
 
         if not is_last and segment_space_count == 0 and len(segment) != 0:
             is_starred = True
@@ -254,78 +278,44 @@ def merge(base, details, are_chords_optional):
         elif segment_far_space_count > 0:
             # replace spaces until detail length with ~
             if (replaced_count := segment_space_count - segment_far_space_count) != 0:
-                segment = re.sub("\\s", "~", segment, count=replaced_count)
+                segment = segment.replace(" ", "~", replaced_count)
 
-        merged += format_chord(detail, are_chords_optional, is_starred)
-        # merged += f"^{'*' if is_starred else ''}{{" + detail + "}"
-        merged += segment
+        merged_parts.append(format_chord(detail, are_chords_optional, is_starred))
+        # merged_parts.append(f"^{'*' if is_starred else ''}{{" + detail + "}")
+        merged_parts.append(segment)
         total_segment_length += segment_length
         is_starred = False
-    return merged
+    return "".join(merged_parts)
 
 def get_group_padding_length(line):
     # try : < first, then : (and for .)
-    if re.search("[\\.:]", line) is None:
+    separator_positions = [i for i in (line.find(':'), line.find('.')) if i >= 0]
+    if not separator_positions:
         return 0
-    return len(re.split("[\\.:]", line, maxsplit=1)[0]) + 2 # assume : < spacing
+    return min(separator_positions) + 2 # assume : < spacing
 
 ## Song manipulation ##############################################################
 
-def parse_checked_line_type_predictions(lines):
-    """Return a tuple with a particular user command and the clean pairs of line and type"""
-    pass
-
-###################################################################################
+LINE_TYPE_CHARS = {
+    LineType.EMPTY: "e",
+    LineType.VERSE: "v",
+    LineType.CHORUS: "r",
+    LineType.CHORDS: "c",
+    LineType.BRIDGE: "b",
+    LineType.SOLO: "s",
+    LineType.VERSE_WITH_CHORDS: "V",
+    LineType.CHORUS_WITH_CHORDS: "R",
+    LineType.BRIDGE_WITH_CHORDS: "B",
+    LineType.SOLO_WITH_CHORDS: "S",
+    LineType.TEXT: " ",
+}
+CHAR_LINE_TYPES = {char: line_type for line_type, char in LINE_TYPE_CHARS.items()}
 
 def format_line_type(line_type):
-    match line_type:
-        case LineType.EMPTY:
-            return "e"
-        case LineType.VERSE:
-            return "v"
-        case LineType.CHORUS:
-            return "r"
-        case LineType.CHORDS:
-            return "c"
-        case LineType.BRIDGE:
-            return "b"
-        case LineType.SOLO:
-            return "s"
-        case LineType.VERSE_WITH_CHORDS:
-            return "V"
-        case LineType.CHORUS_WITH_CHORDS:
-            return "R"
-        case LineType.BRIDGE_WITH_CHORDS:
-            return "B"
-        case LineType.SOLO_WITH_CHORDS:
-            return "S"
-        case LineType.TEXT:
-            return " "
+    return LINE_TYPE_CHARS.get(line_type)
 
 def parse_line_type(text):
-    match text:
-        case "e":
-            return LineType.EMPTY
-        case "v":
-            return LineType.VERSE
-        case "r":
-            return LineType.CHORUS
-        case "c":
-            return LineType.CHORDS
-        case "b":
-            return LineType.BRIDGE
-        case "s":
-            return LineType.SOLO
-        case "V":
-            return LineType.VERSE_WITH_CHORDS
-        case "R":
-            return LineType.CHORUS_WITH_CHORDS
-        case "B":
-            return LineType.BRIDGE_WITH_CHORDS
-        case "S":
-            return LineType.SOLO_WITH_CHORDS
-        case " ":
-            return LineType.TEXT
+    return CHAR_LINE_TYPES.get(text)
 
 def format_line_annotations(line_annotations):
     output = []
@@ -334,13 +324,15 @@ def format_line_annotations(line_annotations):
     return '\n'.join(output)
 
 
-def annotated_lines_to_song(annotated_lines):
-    formatted_lines = format_annotated_lines([(parse_line_type(type_char), line) for type_char, line in annotated_lines])
-    formatted_lines.insert(0, "\\begin{song}{}")
-    formatted_lines.insert(0, f"\\mysong{{{song['title']}}}{{{song['artist']}}}{{{str(song['release_year'])}}}{{}}")
-    formatted_lines.append("\\end{song}")
-    formatted_lines.append("\\pagebreak")
-    return "\n".join(formatted_lines)
+def format_song(song, annotated_lines):
+    """Format the annotated lines into the LaTeX lines of a whole song."""
+    return [
+        f"\\mysong{{{song['title']}}}{{{song['artist']}}}{{{str(song['release_year'])}}}{{}}",
+        "\\begin{song}{}",
+        *format_annotated_lines(annotated_lines),
+        "\\end{song}",
+        "\\pagebreak",
+    ]
 
 
 def process_song(song, use_existing_annotations, use_existing_formatted):
@@ -354,20 +346,21 @@ def process_song(song, use_existing_annotations, use_existing_formatted):
 
             def write_to_preview(annotated_file_name):
                 with open(annotated_file_name, "rt") as input_file:
-                    with open("songs/preview.tex", "wt") as output_file:
-                        output_file.write(annotated_lines_to_song([(parse_line_type(type_char), line) for type_char, line in [(line[0], line[4:]) for line in input_file.readlines()]]))
+                    write_if_changed("songs/preview.tex", "\n".join(format_song(song, [(parse_line_type(line[0]), line[4:]) for line in input_file.read().splitlines()])))
             modified = present_to_user(format_line_annotations(annotated_lines), on_change=write_to_preview)
             song['annotated_lines'] = [(line[0], line[4:]) for line in modified.splitlines()]
+            annotated_lines = [(parse_line_type(type_char), line) for type_char, line in song['annotated_lines']]
+        elif not (use_existing_annotations and 'annotated_lines' in song):
+            # the stored annotations get formatted, not the fresh prediction
+            annotated_lines = None
 
         while True:
             if use_existing_formatted and 'formatted_lines' in song:
                 formatted_lines = song['formatted_lines'].splitlines()
             else:
-                formatted_lines = format_annotated_lines([(parse_line_type(type_char), line) for type_char, line in song['annotated_lines']])
-                formatted_lines.insert(0, "\\begin{song}{}")
-                formatted_lines.insert(0, f"\\mysong{{{song['title']}}}{{{song['artist']}}}{{{str(song['release_year'])}}}{{}}")
-                formatted_lines.append("\\end{song}")
-                formatted_lines.append("\\pagebreak")
+                if annotated_lines is None:
+                    annotated_lines = [(parse_line_type(type_char), line) for type_char, line in song['annotated_lines']]
+                formatted_lines = format_song(song, annotated_lines)
 
 
             formatted_lines = present_to_user('\n'.join(formatted_lines), "songs/preview.tex")
@@ -384,8 +377,7 @@ def process_song(song, use_existing_annotations, use_existing_formatted):
             cancel = "Clear all edits and cancel"
             
             selection, _ = pick([save, retry_with_changes, retry_ignoring_changes, try_again, cancel], "Next step:")
-            with open('songs/preview.tex', 'wt', encoding="utf-8") as preview_file:
-                preview_file.write("x\n\\pagebreak\n\n" * 3)
+            write_if_changed("songs/preview.tex", "x\n\\pagebreak\n\n" * 3)
 
             if selection == save:
                 return song
@@ -419,6 +411,7 @@ def edit_song(song_list, index):
 
     curr_song = song_list[index]
     prev_song = None if index == 0 else song_list[index-1]
+    song_file_name = f"songs/{slugify(curr_song['title'])}.tex"
 
     prompt = f"[{index + 1}/{len(song_list)}] {curr_song['title']} ({curr_song['artist']} {curr_song['release_year']}):"
 
@@ -434,13 +427,12 @@ def edit_song(song_list, index):
         options.append(edit_formatted_lines)
     options.append(stop)
     default_index = 0
-    if os.path.exists(f"songs/{slugify(curr_song['title'])}.tex"):
+    if os.path.exists(song_file_name):
         default_index = 1
 
     # show formatted lines in preview if exists
     if 'formatted_lines' in curr_song:
-        with open("songs/preview.tex", "w", encoding="utf-8") as preview_file:
-            preview_file.write(curr_song['formatted_lines'])
+        write_if_changed("songs/preview.tex", curr_song['formatted_lines'])
 
     task, _ = pick(options, prompt, default_index = default_index, indicator=">")
 
@@ -448,14 +440,12 @@ def edit_song(song_list, index):
         return None
     if task == skip:
         if 'formatted_lines' in curr_song:
-            with open(f"songs/{slugify(curr_song['title'])}.tex", "wt", encoding="utf-8") as output_file:
-                output_file.write(curr_song['formatted_lines'])
+            write_if_changed(song_file_name, curr_song['formatted_lines'])
         return song_list, index + 1
     if task in [edit, edit_line_types, edit_line_types, edit_formatted_lines]:
         processed_song = process_song(curr_song, task == edit_line_types, task == edit_formatted_lines)
         if 'formatted_lines' in processed_song:
-            with open(f"songs/{slugify(curr_song['title'])}.tex", "wt", encoding="utf-8") as output_file:
-                output_file.write(processed_song['formatted_lines'])
+            write_if_changed(song_file_name, processed_song['formatted_lines'])
         song_list[index] = processed_song 
         output_song_list(song_list)
         return song_list, index + 1
@@ -463,13 +453,14 @@ def edit_song(song_list, index):
         return song_list, index - 1
 
 def output_song_list(data):
-    with open("song_with_chords.json", "wt", encoding="utf-8") as output_file:
-        output_file.write(json.dumps(data, indent=3, ensure_ascii=False))
+    # orjson only indents by 2, the tracked file is indented by 3
+    json_bytes = json.dumps(data, indent=3, ensure_ascii=False).encode("utf-8")
+    write_if_changed("song_with_chords.json", json_bytes)
 
 def process_song_list():
-    with open("song_with_chords.json") as input_file:
-        songs = json.load(input_file)
-        songs.sort(key=lambda song: song['title'])
+    raw = Path("song_with_chords.json").read_bytes()
+    songs = orjson.loads(raw) if orjson else json.loads(raw)
+    songs.sort(key=lambda song: song['title'])
  
     song_index = 0
     while (edit_result := edit_song(songs, song_index)) is not None:
@@ -1,9 +1,18 @@
 import os
-from pdfreader import PDFDocument
+import hashlib
+import pypdfium2 as pdfium
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, request, jsonify, make_response
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 
 # -----------------------
 # SAMPLE DATA (replace with your own)
@@ -16,9 +25,20 @@ from flask import Flask, render_template_string, request, jsonify
 # Sort titles by existing order
 
 app = Flask(__name__)
+if Compress:
+    # the song list is very repetitive markup, gzip shrinks it a lot
+    Compress(app)
 
 data = {}
 sorted_titles = list() # sorted(items.keys(), key=lambda t: items[t]["order"])
+rows = list()
+rows_etag = ""
+
+# background and chip class of a song by its page count
+PAGE_COUNT_STYLES = {1: ('#d9f5d9', 'one-page'), 2: ('#fff6c7', 'two-page')}
+DEFAULT_PAGE_COUNT_STYLE = ('#f2f2f2', '')
+
+PAGE_COUNT_CACHE = "page_count_cache.json"  # song -> [pdf mtime, page count], kept out of the user-edited song_order.json
 
 # -----------------------
 # HTML TEMPLATE WITH SORTABLEJS
@@ -74,12 +94,12 @@ TEMPLATE = """
 </head>
 <body>
     <div id=\"list\">
-        {% for title in titles %}
+        {% for title, name, page_count, background, chip_class in rows %}
         <div class=\"item\" data-title=\"{{ title }}\"
-             style=\"background: {{ '#d9f5d9' if data[title].page_count == 1 else ('#fff6c7' if data[title].page_count == 2 else '#f2f2f2') }};\">
-            <span class=\"title\">{{ title.split(".tex")[0] }}</span>
-            <span class=\"page-chip {{ 'one-page' if data[title].page_count == 1 else ('two-page' if data[title].page_count == 2 else '') }}\">
-                {{ data[title].page_count }}
+             style=\"background: {{ background }};\">
+            <span class=\"title\">{{ name }}</span>
+            <span class=\"page-chip {{ chip_class }}\">
+                {{ page_count }}
             </span>
         </div>
         {% endfor %}
@@ -120,14 +140,22 @@ TEMPLATE = """
 </body>
 </html>
 """
+# compiled once, render_template_string would parse it on every request
+_TEMPLATE = app.jinja_env.from_string(TEMPLATE)
 
 @app.route('/')
 def index():
-    return render_template_string(TEMPLATE, titles=sorted_titles, data=data)
+    # the page only changes with the rows, so reloads can reuse the cached one;
+    # the etag is weak so flask_compress doesn't append the encoding to it
+    if request.if_none_match.contains_weak(rows_etag):
+        return "", 304
+    response = make_response(_TEMPLATE.render(rows=rows))
+    response.set_etag(rows_etag, weak=True)
+    return response
 
 @app.route('/save', methods=['POST'])
 def save():
-    global data, sorted_titles
+    global data
 
     new_order = request.get_json()
 
@@ -137,25 +165,51 @@ def save():
         t = entry['title']
         data[t]['order'] = entry['order']
 
-    with open('song_order.json', 'w') as output_file:
-        output_file.write(json.dumps(data, ensure_ascii=False, indent=3))
+    write_song_order(data)
+
+    update_rows()
+    # the page only alerts after saving, it doesn't need the html back
+    return jsonify(ok=True)
 
+def update_rows():
+    global sorted_titles, rows, rows_etag
     sorted_titles = sorted(data.keys(), key=lambda t: data[t]["order"])
-    return render_template_string(TEMPLATE, titles=sorted_titles, data=data)
+    rows = build_rows(sorted_titles)
+    rows_etag = hashlib.blake2b(repr(rows).encode(), digest_size=16).hexdigest()
+
+def build_rows(titles):
+    # everything the template shows is computed here once, not per render,
+    # and handed over as plain tuples so jinja doesn't resolve attributes
+    names = [title.split(".tex")[0] for title in titles]
+    page_counts = [data[title]['page_count'] for title in titles]
+    styles = [PAGE_COUNT_STYLES.get(page_count, DEFAULT_PAGE_COUNT_STYLE) for page_count in page_counts]
+    return [
+        (title, name, page_count, background, chip_class)
+        for title, name, page_count, (background, chip_class) in zip(titles, names, page_counts, styles)
+    ]
 
 # -----------------------
 # RUN SERVER (debug disabled to avoid multiprocessing issues)
 # -----------------------
 def order_songs():
     global data
-    existing_songs = get_existing_song_list()
+    song_entries = get_existing_song_entries()
+    existing_songs = list(song_entries)
+
+    with open("song_order.json", "rb") as input_file:
+        data = load_json(input_file.read())
 
-    with open("song_order.json") as input_file:
-        data = json.loads(input_file.read())
+    # only recount pdfs that changed since their page count was cached
+    page_count_cache = load_page_count_cache()
+    mtimes = {song: entry.stat().st_mtime_ns for song, entry in song_entries.items()}
+    changed_songs = [song for song in existing_songs if page_count_cache.get(song, [None])[0] != mtimes[song]]
+    for existing_song in changed_songs:
+        page_count_cache[existing_song] = [mtimes[existing_song], count_pages(existing_song)]
+    if changed_songs:
+        save_page_count_cache(page_count_cache)
 
     for existing_song in existing_songs:
-        with open(f"output/{existing_song}.pdf", "rb") as song_file:
-            page_count = len(list(PDFDocument(song_file).pages()))
+        page_count = page_count_cache[existing_song][1]
         if existing_song not in data:
             data[existing_song] = {'page_count': page_count, 'order': len(data)}
         else:
@@ -163,25 +217,57 @@ def order_songs():
 
     present_to_user()
 
-def get_existing_song_list():
-    return [ name.split(".pdf")[0] for name in os.listdir("output") if name.endswith(".pdf")]
+def get_existing_song_entries():
+    with os.scandir("output") as entries:
+        return {entry.name.removesuffix(".pdf"): entry for entry in entries if entry.name.endswith(".pdf") and entry.is_file()}
 
 def present_to_user():
-    global data, sorted_titles
-    sorted_titles = sorted(data.keys(), key=lambda t: data[t]["order"])
+    update_rows()
     app.run(debug=False, use_reloader=False, port=5000)
 
 def get_song_data(existing_songs):
     data = {}
-    for index, song in enumerate(existing_songs):
-        with open(f"output/{song}.pdf", "rb") as song_file:
-            page_count = len(list(PDFDocument(song_file).pages()))
-            print(f"{song}\t{page_count}")
-            data[song] = {'page_count': page_count, 'order': index}
-
-    with open(f"song_order.json", "w") as output_file:
-        output_file.write(json.dumps(data, ensure_ascii=False, indent=3))
+    page_count_cache = load_page_count_cache()
+    page_counts = [count_pages(song) for song in existing_songs]
+    for index, (song, page_count) in enumerate(zip(existing_songs, page_counts)):
+        print(f"{song}\t{page_count}")
+        data[song] = {'page_count': page_count, 'order': index}
+        page_count_cache[song] = [get_song_mtime(song), page_count]
+
+    write_song_order(data)
+    save_page_count_cache(page_count_cache)
     return data
 
+def count_pages(song):
+    pdf = pdfium.PdfDocument(f"output/{song}.pdf")
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def get_song_mtime(song):
+    return os.stat(f"output/{song}.pdf").st_mtime_ns
+
+def load_page_count_cache():
+    """Load the page counts counted by earlier runs, keyed by song as [mtime_ns, page_count]."""
+    try:
+        with open(PAGE_COUNT_CACHE, "rb") as input_file:
+            return load_json(input_file.read())
+    except FileNotFoundError:
+        return {}
+
+def save_page_count_cache(cache):
+    with open(PAGE_COUNT_CACHE, "wb") as output_file:
+        output_file.write(json.dumps(cache, ensure_ascii=False).encode())
+
+def load_json(raw):
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def write_song_order(data):
+    # orjson only indents by 2, the tracked file is indented by 3
+    raw = json.dumps(data, ensure_ascii=False, indent=3).encode()
+    with open("song_order.json", "wb") as output_file:
+        output_file.write(raw)
+
 if __name__ == "__main__":
     order_songs()
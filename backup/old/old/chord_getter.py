@@ -1,8 +1,17 @@
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-from bs4 import BeautifulSoup, NavigableString
-from typing import Dict, Optional, List
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+from typing import Dict, Iterator, Optional, List
 import json
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
 
 # --- Configuration ---
 SEARCH_INPUT_SELECTOR = "input.ais-SearchBox-input"
@@ -14,6 +23,12 @@ SUGGESTION_ITEM_SELECTORS = [
 ]
 TYPING_DELAY = 0.05  # seconds per keystroke
 PAGE_LOAD_TIMEOUT = 7  # max seconds to wait for homepage
+# pages downloaded at once, kept low so the site isn't hammered
+FETCH_WORKERS = int(os.environ.get("CHORD_FETCH_WORKERS", "4"))
+REQUEST_TIMEOUT = 10  # seconds per request
+
+# only the chords, title and artist are read from a song page
+SONG_PARTS = SoupStrainer(["pre", "h1", "h2"])
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -21,6 +36,15 @@ HEADERS = {
                   "Chrome/117.0 Safari/537.36"
 }
 
+# one pooled session for all requests, so the TLS connection is reused
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
+
 ####################################################################
 
 def extract_song(url: str) -> Optional[Dict[str, str]]:
@@ -29,13 +53,13 @@ def extract_song(url: str) -> Optional[Dict[str, str]]:
     Returns None if the page cannot be processed.
     """
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
+        resp = SESSION.get(url, timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
     except Exception as e:
         print(f"Failed to fetch {url}: {e}")
         return None
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(resp.content, PARSER)
 
     # Example observation of site structure:
     # Lyrics/chords are often inside <pre> or <div class="songtext"> or similar
@@ -67,30 +91,28 @@ def extract_song(url: str) -> Optional[Dict[str, str]]:
     }
 
 
-def extract_chords_and_lyrics(html: str, url: str):
-    soup = BeautifulSoup(html, "html.parser")
+def extract_chords_and_lyrics(html: bytes, url: str):
+    soup = BeautifulSoup(html, PARSER, parse_only=SONG_PARTS)
 
     output_lines = []
 
     # find all chord blocks
-    for el in soup.find("pre").find_all("el", class_="aline"):
+    # match the class on any tag, the chord lines are not always <el>
+    for el in soup.find("pre").find_all(class_="aline"):
         # ----- extract chord line -----
-        chord_line = ""
+        chord_parts = []
 
         # We keep the inline structure: text + spans
         for item in el.children:
             if isinstance(item, NavigableString):
-                chord_line += str(item)
+                chord_parts.append(str(item))
             else:
                 # chords are in <a> inside <span class="akord">
                 a = item.find("a")
-                if a:
-                    chord_line += a.get_text()
-                else:
-                    chord_line += item.get_text()
+                chord_parts.append(a.get_text() if a else item.get_text())
 
         # Strip only right side to maintain indentation
-        chord_line = chord_line.rstrip()
+        chord_line = "".join(chord_parts).rstrip()
         output_lines.append(chord_line)
 
         # ----- extract lyric line following <el> -----
@@ -141,25 +163,36 @@ def extract_song_aligned(url: str) -> Optional[Dict[str, str]]:
     Returns None if extraction fails.
     """
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
+        resp = SESSION.get(url, timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return None
 
-    return extract_chords_and_lyrics(resp.text, url)
+    try:
+        return extract_chords_and_lyrics(resp.content, url)
+    except Exception as e:
+        # one page with an unexpected layout shouldn't stop the whole batch
+        print(f"Error parsing {url}: {e}")
+        return None
+
+def iter_songs(urls: List[str]) -> Iterator[Dict[str, str]]:
+    urls = list(urls)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = []
+        for url in urls:
+            print(f"Extracting: {url}")
+            futures.append(executor.submit(extract_song_aligned, url))
+        for url, future in zip(urls, futures):
+            song = future.result()
+            if song:
+                print(f"{url} → {song['title']}")
+                yield song
+            else:
+                print(f"{url} → failed or skipped.")
 
 def extract_multiple(urls: List[str]) -> List[Dict[str, str]]:
-    results = []
-    for url in urls:
-        print(f"Extracting: {url}")
-        song = extract_song_aligned(url)
-        if song:
-            print(f" → {song['title']}")
-            results.append(song)
-        else:
-            print(" → failed or skipped.")
-    return results
+    return list(iter_songs(urls))
 
 
 def get_contents(urls: List[str]):
@@ -182,10 +215,11 @@ def get_song_info(title: str, artist = None):
         'fmt': 'json',
         'limit': 1
     }
-    resp = requests.get(
+    resp = SESSION.get(
         "https://musicbrainz.org/ws/2/recording/",
         params=params,
-        headers={"User-Agent": "song-info-tool/0.1 (your-email@example.com)"}
+        headers={"User-Agent": "song-info-tool/0.1 (your-email@example.com)"},
+        timeout=REQUEST_TIMEOUT,
     )
 
     if resp.status_code != 200:
@@ -217,20 +251,33 @@ def main():
     with open('song_url_list.json') as f:
         songs = json.load(f)
     song_urls = songs.values()
-    songs = get_contents(song_urls)
-    json_string = json.dumps(songs)
-
-    with open("song_metadata.json", "wt") as output_file:
-        output_file.write(json_string)
-    for s in songs:
-        print("\n" + "="*40)
-        print(f"Title: {s['title']}")
-        print(f"Group: {s['artist']}")
-        print(f"Year: {s['year']}")
-        print(f"URL: {s['url']}")
-        print("Chords & Lyrics:\n")
-        print(s['chords_and_lyrics'])
-        print("="*40 + "\n")
+
+    # the array is written song by song instead of dumping it all at the end,
+    # into a temp file so a crash leaves the previous song_metadata.json intact
+    tmp_path = "song_metadata.json.tmp"
+    with open(tmp_path, "wb") as output_file:
+        output_file.write(b"[")
+        for index, s in enumerate(iter_songs(song_urls)):
+            if index > 0:
+                output_file.write(b",")
+            output_file.write(dump_json(s))
+            print_song(s)
+        output_file.write(b"]")
+    os.replace(tmp_path, "song_metadata.json")
+
+def dump_json(obj) -> bytes:
+    # orjson drops the spaces after separators, keep the stdlib formatting
+    return json.dumps(obj).encode()
+
+def print_song(s):
+    print("\n" + "="*40)
+    print(f"Title: {s['title']}")
+    print(f"Group: {s['artist']}")
+    print(f"Year: {s['year']}")
+    print(f"URL: {s['url']}")
+    print("Chords & Lyrics:\n")
+    print(s['chords_and_lyrics'])
+    print("="*40 + "\n")
 
 if __name__ == "__main__":
     main()